@@ -19,6 +19,7 @@ from datetime import datetime, timezone
 from typing import Callable, AsyncIterator, TypeVar, Any
 from typing import Iterable
 
+import orjson
 import starlette.datastructures
 import starlette.requests
 from starlette.background import BackgroundTask
@@ -56,6 +57,13 @@ class JSONStreamingResponse(StreamingResponse, JSONResponse):
         self.background = background
         self.init_headers(headers)
 
+    def render(self, content: Any) -> bytes:
+        """
+        Called once per streamed chunk, so use orjson rather than JSONResponse's stdlib `json.dumps`.
+        Output is the same compact UTF-8 JSON.
+        """
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
 
 T = TypeVar('T')
 U = TypeVar('U')
@@ -1,3 +1,4 @@
+import functools
 from datetime import datetime
 from typing import Optional
 
@@ -21,6 +22,19 @@ class ChatMessage(BaseModel):
         frozen=True,
     )
 
+    @functools.cached_property
+    def chat_completion_dict(self) -> JSONDict:
+        """
+        The `{"role", "content"}` dict that chat completion APIs read, built without pydantic's serializer.
+
+        Memoized, since messages are frozen and get re-sent on every inference call.
+        Callers must treat the result as read-only.
+        """
+        return {
+            "role": self.role,
+            "content": self.content,
+        }
+
 
 class ChatMessageResponse(ChatMessage):
     message_id: ChatMessageID
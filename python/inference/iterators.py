@@ -1,4 +1,8 @@
+import asyncio
 import logging
+import os
+import sys
+import threading
 from typing import AsyncIterator, Callable, TypeVar, Awaitable, Any, Iterator
 
 from orjson import orjson
@@ -10,12 +14,95 @@ logger = logging.getLogger(__name__)
 T = TypeVar('T')
 U = TypeVar('U')
 
+console_tee_enabled: bool = sys.stdout.isatty() and os.environ.get("BROKEGEN_CONSOLE_TEE", "1") != "0"
+"""Server deployments usually aren't watching stdout, so skip per-chunk console output unless someone is."""
+
 
 async def to_async(iter: Iterator[T]) -> AsyncIterator[T]:
     for chunk in iter:
         yield chunk
 
 
+async def to_async_threaded_batches(
+        iter: Iterator[T],
+        max_batch_len: int | None = None,
+        max_queue_len: int | None = None,
+) -> AsyncIterator[list[T]]:
+    """
+    Items are handed over through an asyncio.Queue, which costs one `call_soon_threadsafe` per item
+    instead of one thread round-trip per `next()`.
+
+    Each batch is whatever the producer has already queued up (never waiting for more), so batching
+    only kicks in when the consumer falls behind, and adds no latency.
+
+    If `max_queue_len` is set, the producer blocks once it's that far ahead of the consumer.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done_sentinel = object()
+    producer_error: BaseException | None = None
+    stop_requested = threading.Event()
+    # A plain counting semaphore, rather than asyncio.Queue(maxsize), so the producer can wait without a loop round-trip.
+    queue_slots: threading.Semaphore | None = threading.Semaphore(max_queue_len) if max_queue_len else None
+
+    def producer() -> None:
+        nonlocal producer_error
+
+        try:
+            for chunk in iter:
+                if queue_slots is not None:
+                    queue_slots.acquire()
+                if stop_requested.is_set():
+                    break
+
+                loop.call_soon_threadsafe(queue.put_nowait, chunk)
+
+        except BaseException as e:
+            producer_error = e
+
+        finally:
+            # Close generators from the thread that was running them.
+            close_fn = getattr(iter, "close", None)
+            if close_fn is not None:
+                close_fn()
+
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(queue.put_nowait, done_sentinel)
+
+    threading.Thread(target=producer, daemon=True).start()
+
+    try:
+        producer_done: bool = False
+        while not producer_done:
+            batch: list[T] = []
+
+            chunk = await queue.get()
+            while True:
+                if chunk is done_sentinel:
+                    producer_done = True
+                    break
+
+                batch.append(chunk)
+                if (max_batch_len is not None and len(batch) >= max_batch_len) or queue.empty():
+                    break
+
+                chunk = queue.get_nowait()
+
+            if batch:
+                if queue_slots is not None:
+                    queue_slots.release(len(batch))
+                yield batch
+
+        if producer_error is not None:
+            raise producer_error
+
+    finally:
+        stop_requested.set()
+        if queue_slots is not None:
+            # Wake the producer, in case it's waiting on a slot.
+            queue_slots.release()
+
+
 async def encode_to_bytes(primordial: AsyncIterator[str]) -> AsyncIterator[bytes]:
     chunk: str
     async for chunk in primordial:
@@ -81,10 +168,28 @@ async def stream_bytes_to_json(
             raise RuntimeError(f"Failed to decode {len(b''.join(buffered_chunks))} bytes in JSON response")
 
 
-async def tee_to_console_output(
+def tee_to_console_output(
         primordial_t: AsyncIterator[T],
         indexer: Callable[[T], str],
         max_buffer_len: int = 120,
+        enabled: bool | None = None,
+) -> AsyncIterator[T]:
+    """
+    When disabled (by default, when stdout isn't a TTY), this returns the input unwrapped,
+    so there's no extra async generator layer per chunk.
+    """
+    if enabled is None:
+        enabled = console_tee_enabled
+    if not enabled:
+        return primordial_t
+
+    return _tee_to_console_output(primordial_t, indexer, max_buffer_len)
+
+
+async def _tee_to_console_output(
+        primordial_t: AsyncIterator[T],
+        indexer: Callable[[T], str],
+        max_buffer_len: int,
 ) -> AsyncIterator[T]:
     buffer = ""
 
@@ -107,9 +212,12 @@ async def consolidate_and_call(
         consolidator: Callable[[T, U], U],
         initializer: U,
         *on_done_fns: Callable[[U], Awaitable[Any]],
+        finalizer: Callable[[U], U] | None = None,
 ) -> AsyncIterator[T]:
     """
     This is basically an async functools.reduce()
+
+    `finalizer` runs once on the consolidated response, before it's handed to any of the on_done_fns.
     """
     consolidated_response: U = initializer
 
@@ -117,6 +225,9 @@ async def consolidate_and_call(
         yield chunk_t
         consolidated_response = consolidator(chunk_t, consolidated_response)
 
+    if finalizer is not None:
+        consolidated_response = finalizer(consolidated_response)
+
     for on_done_fn in on_done_fns:
         await on_done_fn(consolidated_response)
 
@@ -126,9 +237,12 @@ async def consolidate_and_yield(
         consolidator: Callable[[T, U], U],
         initializer: U,
         *on_done_fns: Callable[[U], AsyncIterator[T]],
+        finalizer: Callable[[U], U] | None = None,
 ) -> AsyncIterator[T]:
     """
     This is basically an async functools.reduce()
+
+    `finalizer` runs once on the consolidated response, before it's handed to any of the on_done_fns.
     """
     consolidated_response: U = initializer
 
@@ -136,6 +250,9 @@ async def consolidate_and_yield(
         yield chunk_t
         consolidated_response = consolidator(chunk_t, consolidated_response)
 
+    if finalizer is not None:
+        consolidated_response = finalizer(consolidated_response)
+
     for on_done_fn in on_done_fns:
         async for post_chunk in on_done_fn(consolidated_response):
             yield post_chunk
@@ -0,0 +1,79 @@
+import asyncio
+import threading
+
+import pytest
+
+from inference.iterators import to_async_threaded_batches, tee_to_console_output
+
+
+async def _flatten(primordial):
+    return [chunk async for batch in primordial for chunk in batch]
+
+
+def test_threaded_preserves_order():
+    async def collect():
+        return await _flatten(to_async_threaded_batches(iter(range(100))))
+
+    assert asyncio.run(collect()) == list(range(100))
+
+
+def test_threaded_runs_off_loop_thread():
+    loop_thread = threading.get_ident()
+
+    def producer():
+        yield threading.get_ident()
+
+    async def collect():
+        return await _flatten(to_async_threaded_batches(producer()))
+
+    assert asyncio.run(collect()) != [loop_thread]
+
+
+def test_threaded_reraises_producer_errors():
+    def producer():
+        yield 1
+        raise ValueError("producer failed")
+
+    async def collect():
+        return await _flatten(to_async_threaded_batches(producer()))
+
+    with pytest.raises(ValueError):
+        asyncio.run(collect())
+
+
+def test_tee_disabled_returns_input():
+    async def primordial():
+        yield "chunk"
+
+    iter0 = primordial()
+    assert tee_to_console_output(iter0, lambda s: s, enabled=False) is iter0
+
+
+def test_threaded_batches_respect_max_len():
+    async def collect():
+        return [batch async for batch in to_async_threaded_batches(iter(range(100)), max_batch_len=16)]
+
+    batches = asyncio.run(collect())
+    assert all(1 <= len(batch) <= 16 for batch in batches)
+    assert [chunk for batch in batches for chunk in batch] == list(range(100))
+
+
+def test_threaded_batches_bound_queue_len():
+    produced: list[int] = []
+
+    def producer():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    async def collect():
+        consumed = 0
+        async for batch in to_async_threaded_batches(producer(), max_queue_len=4):
+            consumed += len(batch)
+            # Give the producer time to run as far ahead as it's allowed to
+            await asyncio.sleep(0.01)
+            assert len(produced) - consumed <= 4 + 1
+
+        return consumed
+
+    assert asyncio.run(collect()) == 100
@@ -1,7 +1,9 @@
+import functools
 import logging
 from abc import abstractmethod
 from typing import AsyncGenerator, Self, AsyncIterator, Awaitable, Optional
 
+import orjson
 from pydantic import BaseModel
 
 from _util.json import JSONDict
@@ -17,12 +19,29 @@ from .orm import ProviderLabel, ProviderRecord, ProviderType
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=128)
+def _parse_inference_options(inference_options: str) -> JSONDict:
+    return orjson.loads(inference_options)
+
+
 class InferenceOptions(BaseModel):
     inference_options: Optional[str] = None
     override_model_template: Optional[str] = None
     override_system_prompt: Optional[PromptText] = None
     seed_assistant_response: Optional[PromptText] = None
 
+    @property
+    def parsed_inference_options(self) -> JSONDict:
+        """
+        Clients tend to send the same options string every turn, so parses are shared across requests.
+
+        The returned dict is shared too; copy it before modifying.
+        """
+        if not self.inference_options:
+            return {}
+
+        return _parse_inference_options(self.inference_options)
+
 
 class BaseProvider:
     cached_model_infos: list[FoundationModelRecord] = []
@@ -1 +1 @@
-from . import factory, provider
+from . import factory, orm, provider
@@ -7,6 +7,18 @@ from providers.registry import BaseProvider, ProviderRegistry, ProviderFactory
 logger = logging.getLogger(__name__)
 
 
+def _int_from_env(name: str) -> int | None:
+    value: str | None = os.environ.get(name)
+    if not value:
+        return None
+
+    try:
+        return int(value)
+    except ValueError:
+        logger.warning(f"Ignoring non-integer {name}={value!r}")
+        return None
+
+
 class LlamaCppProviderFactory(ProviderFactory):
     search_dirs: list[str]
 
@@ -26,7 +38,18 @@ class LlamaCppProviderFactory(ProviderFactory):
             import llama_cpp
             from .provider import LlamaCppProvider
 
-            new_provider: BaseProvider = LlamaCppProvider(search_dir=label.id)
+            provider_kwargs: dict[str, int] = {}
+            # Opt-in, since it snapshots the KV state after every completion; e.g. `2147483648` for 2 GiB.
+            prompt_cache_bytes: int | None = _int_from_env("BROKEGEN_LCP_PROMPT_CACHE_BYTES")
+            if prompt_cache_bytes:
+                provider_kwargs["prompt_cache_bytes"] = prompt_cache_bytes
+            # Prefill batching and CPU threads, e.g. `BROKEGEN_LCP_N_BATCH=4096`; unset keeps the provider defaults.
+            for launch_param in ("n_batch", "n_ubatch", "n_threads", "n_threads_batch"):
+                launch_value: int | None = _int_from_env(f"BROKEGEN_LCP_{launch_param.upper()}")
+                if launch_value:
+                    provider_kwargs[launch_param] = launch_value
+
+            new_provider: BaseProvider = LlamaCppProvider(search_dir=label.id, **provider_kwargs)
             if await new_provider.available():
                 return new_provider
             else:
@@ -0,0 +1,97 @@
+import functools
+import importlib.metadata
+import os
+
+from sqlalchemy import Column, Integer, String, JSON, Boolean, delete, select
+
+from client.database import Base, HistoryDB
+
+
+class GgufMetadataCacheOrm(Base):
+    """
+    Results of opening a .gguf with `llama_cpp.Llama(vocab_only=True)`, which is slow enough
+    that we don't want to redo it for every file on every model scan.
+
+    Rows are only valid while the file's (mtime, size) still match, and only for the llama_cpp version
+    that wrote them: a newer one might load models (or report params) that the old one couldn't.
+    """
+    __tablename__ = 'LlamaCppGgufMetadataCache'
+
+    model_path: str = Column(String, primary_key=True, nullable=False)
+    st_mtime_ns: int = Column(Integer, nullable=False)
+    st_size: int = Column(Integer, nullable=False)
+    llama_cpp_version: str | None = Column(String)
+
+    tokenizer_roundtrips: bool | None = Column(Boolean)
+    """Result of the tokenize/detokenize test in `_OneModel.available()`; NULL if not run yet."""
+    gguf_metadata = Column(JSON)
+    """`Llama.metadata`, without any of the path-dependent fields we add to `model_identifiers`."""
+    inference_params = Column(JSON)
+
+
+@functools.cache
+def _llama_cpp_version() -> str | None:
+    # Read from the package metadata, so cache hits never have to load llama_cpp's native library.
+    try:
+        return importlib.metadata.version("llama_cpp_python")
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def lookup_gguf_metadata(
+        model_path: str,
+        history_db: HistoryDB,
+) -> GgufMetadataCacheOrm:
+    """
+    Returns the cache row for this file, resetting it if the file changed since it was written.
+
+    Newly-created or reset rows are added to the session, but not committed.
+    """
+    file_stat = os.stat(model_path)
+
+    cache_entry: GgufMetadataCacheOrm | None = history_db.get(GgufMetadataCacheOrm, model_path)
+    if cache_entry is None:
+        cache_entry = GgufMetadataCacheOrm(model_path=model_path)
+        history_db.add(cache_entry)
+
+    elif (
+            cache_entry.st_mtime_ns == file_stat.st_mtime_ns
+            and cache_entry.st_size == file_stat.st_size
+            and cache_entry.llama_cpp_version == _llama_cpp_version()
+    ):
+        return cache_entry
+
+    cache_entry.st_mtime_ns = file_stat.st_mtime_ns
+    cache_entry.st_size = file_stat.st_size
+    cache_entry.llama_cpp_version = _llama_cpp_version()
+    cache_entry.tokenizer_roundtrips = None
+    cache_entry.gguf_metadata = None
+    cache_entry.inference_params = None
+
+    return cache_entry
+
+
+def prune_gguf_metadata(
+        search_dir: str,
+        seen_paths: set[str],
+        history_db: HistoryDB,
+) -> int:
+    """
+    Deletes cache rows for files under `search_dir` that a complete scan didn't find, i.e. deleted or moved models.
+
+    Returns the number of rows deleted; like `lookup_gguf_metadata`, this doesn't commit.
+    """
+    path_prefix: str = os.path.join(os.path.abspath(search_dir), '')
+    cached_paths = history_db.execute(
+        select(GgufMetadataCacheOrm.model_path)
+        .where(GgufMetadataCacheOrm.model_path.startswith(path_prefix, autoescape=True))
+    ).scalars()
+
+    stale_paths: list[str] = [path for path in cached_paths if path not in seen_paths]
+    if stale_paths:
+        history_db.execute(
+            delete(GgufMetadataCacheOrm)
+            .where(GgufMetadataCacheOrm.model_path.in_(stale_paths))
+        )
+
+    return len(stale_paths)
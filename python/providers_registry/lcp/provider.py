@@ -1,127 +1,417 @@
+import asyncio
+import contextlib
+import ctypes
+import functools
 import logging
 import os
+import threading
+from collections import OrderedDict
 from datetime import datetime, timezone
-from typing import AsyncGenerator, AsyncIterator, Iterator
+from typing import Any, AsyncGenerator, AsyncIterator, Iterator, TypeAlias, TYPE_CHECKING
 
-import llama_cpp
 import orjson
 import sqlalchemy
-from sqlalchemy import select
+from sqlalchemy import func, insert, select, update
 
-from _util.json import JSONDict, safe_get, safe_get_arrayed
+from _util.json import JSONDict, safe_get
 from _util.status import ServerStatusHolder
-from _util.typing import FoundationModelRecordID
+from _util.typing import FoundationModelRecordID, FoundationModelHumanID
 from audit.http import AuditDB
 from client.database import HistoryDB, get_db as get_history_db
 from client.message import ChatMessage
-from inference.iterators import to_async, consolidate_and_call
+from inference.iterators import to_async_threaded_batches
 from providers.foundation_models.orm import FoundationModelRecord, FoundationModelAddRequest, \
-    lookup_foundation_model_detailed, FoundationModelRecordOrm, InferenceEventOrm
+    FoundationModelRecordOrm, InferenceEventOrm
 from providers.orm import ProviderRecord, ProviderRecordOrm
 from providers.registry import BaseProvider, InferenceOptions
 from providers_registry._util import local_provider_identifiers, local_fetch_machine_info
+from .orm import GgufMetadataCacheOrm, lookup_gguf_metadata, prune_gguf_metadata
+
+if TYPE_CHECKING:
+    # Loading llama_cpp also loads libllama, so only import it once we actually need it.
+    import llama_cpp
 
 logger = logging.getLogger(__name__)
 
+_background_tasks: set[asyncio.Task] = set()
+"""Keeps references to fire-and-forget tasks, since the event loop only holds weak references."""
+
+_llama_construction_lock = threading.Lock()
+"""
+Held around every `llama_cpp.Llama()` construction.
+
+With `verbose=False`, llama_cpp silences loading by `dup2()`-ing the process-wide stdout/stderr fds onto /dev/null
+and back, without any locking; two overlapping loads can leave them pointed at /dev/null for good.
+Backend initialization is also an unlocked check-then-set.
+"""
+
+
+@functools.cache
+def _model_param_fields(model_params_type: type) -> tuple[tuple[str, bool], ...]:
+    """
+    Returns `(field, always_int)` for every field of `llama_cpp.llama_model_params`, computed once per ctypes type.
+
+    Integer/bool ctypes always read back as Python ints; pointer fields can read back as either None or an int,
+    so those still have to be classified per value.
+    """
+    return tuple(
+        (
+            field,
+            isinstance(field_type, type)
+            and issubclass(field_type, ctypes._SimpleCData)
+            and field_type._type_ in "?bBhHiIlLqQ",
+        )
+        for field, field_type, *_ in model_params_type._fields_
+    )
+
+
+def chat_completion_choice0_extractor(chunk: JSONDict) -> str:
+    """
+    Runs once per streamed token, so this skips `safe_get_arrayed` in favor of direct indexing.
+
+    llama_cpp only ever returns one choice for `n=1`, so extra choices are silently ignored.
+    """
+    try:
+        return chunk["choices"][0]["delta"].get("content") or ""
+    except (KeyError, IndexError, TypeError):
+        return ""
+
+
+def coalesce_chat_completion_chunks(chunks: list[JSONDict]) -> tuple[JSONDict, str]:
+    """
+    Merges already-received streaming chunks into the last one, so the rest of the pipeline sees fewer packets.
+
+    The last chunk is the one that carries `finish_reason`, so it's kept as the base. Other delta fields
+    (like the `role` that only the stream's first chunk carries) are merged in, with later chunks winning.
+
+    Returns `(merged_chunk, merged_content)`, so callers don't need to extract the content a second time.
+    """
+    if len(chunks) == 1:
+        return chunks[0], chat_completion_choice0_extractor(chunks[0])
+
+    merged_delta: JSONDict = {}
+    merged_content_parts: list[str] = []
+    for chunk in chunks:
+        try:
+            delta: JSONDict = chunk["choices"][0]["delta"]
+        except (KeyError, IndexError, TypeError):
+            continue
+
+        merged_delta.update(delta)
+        merged_content_parts.append(delta.get("content") or "")
+
+    merged_content = "".join(merged_content_parts)
+    merged_delta["content"] = merged_content
+
+    merged_chunk = chunks[-1]
+    try:
+        merged_chunk["choices"][0]["delta"] = merged_delta
+    except (KeyError, IndexError, TypeError):
+        logger.warning(f"Couldn't coalesce {len(chunks)} chunks, dropping {len(merged_content)} chars of content")
+        return merged_chunk, ""
+
+    return merged_chunk, merged_content
+
+
+_ExistingModelKey: TypeAlias = tuple[FoundationModelHumanID, bytes, bytes]
+
+
+def _existing_model_key(
+        human_id: FoundationModelHumanID,
+        model_identifiers: JSONDict | None,
+        inference_params: JSONDict | None,
+) -> _ExistingModelKey:
+    """
+    Mirrors the columns `lookup_foundation_model_detailed` matches on, for lookups against prefetched records.
+    """
+    return (
+        human_id,
+        orjson.dumps(model_identifiers, option=orjson.OPT_SORT_KEYS),
+        orjson.dumps(inference_params, option=orjson.OPT_SORT_KEYS),
+    )
+
+
+def _context_length_from(model_identifiers: JSONDict | None) -> int | None:
+    """
+    Reads the training context length out of GGUF metadata, which namespaces it by architecture
+    (e.g. `llama.context_length`). llama_cpp reports every metadata value as a string.
+    """
+    architecture = safe_get(model_identifiers, "general.architecture")
+    if not architecture:
+        return None
+
+    try:
+        return int(safe_get(model_identifiers, f"{architecture}.context_length"))
+    except (TypeError, ValueError):
+        return None
+
 
 class _OneModel:
     model_path: str
-    underlying_model: llama_cpp.Llama | None = None
-
-    def __init__(self, model_path: str):
+    n_ctx_train: int | None
+    """Context length the model was trained with, if the GGUF metadata says."""
+    underlying_model: 'llama_cpp.Llama | None' = None
+    inference_lock: threading.Lock
+    """llama_cpp.Llama isn't thread-safe, so only one request's token loop may run against it at a time."""
+    launch_lock: asyncio.Lock
+    """Loading happens off the event loop, so concurrent requests need to wait for the first one's load."""
+
+    def __init__(self, model_path: str, n_ctx_train: int | None = None):
         self.model_path = model_path
+        self.n_ctx_train = n_ctx_train
+        self.inference_lock = threading.Lock()
+        self.launch_lock = asyncio.Lock()
 
     async def launch(
             self,
-            verbose: bool = False,
+            verbose: bool | None = None,
+            prompt_cache_bytes: int | None = None,
+            max_n_ctx: int = 32_768,
+            n_batch: int = 2048,
+            n_ubatch: int = 512,
+            n_threads: int | None = None,
+            n_threads_batch: int | None = None,
     ):
+        """
+        `n_batch`/`n_ubatch` only affect prompt processing: how many tokens get submitted per decode call,
+        and how many of those the backend evaluates per pass. Bigger is faster for long prompts, at the cost
+        of a larger compute buffer.
+
+        Thread counts left as `None` use llama_cpp's defaults, which already split these sensibly:
+        about half the logical cores for (memory-bound) generation, and all of them for prompt processing.
+        """
         if self.underlying_model is not None:
             return
 
+        async with self.launch_lock:
+            if self.underlying_model is None:
+                await self._launch_nolock(
+                    verbose, prompt_cache_bytes, max_n_ctx, n_batch, n_ubatch, n_threads, n_threads_batch)
+
+    async def _launch_nolock(
+            self,
+            verbose: bool | None,
+            prompt_cache_bytes: int | None,
+            max_n_ctx: int,
+            n_batch: int,
+            n_ubatch: int,
+            n_threads: int | None,
+            n_threads_batch: int | None,
+    ):
+        if verbose is None:
+            # llama.cpp's own load logging goes straight to stderr, one line per tensor/layer.
+            verbose = os.environ.get("BROKEGEN_LCP_VERBOSE", "0") != "0"
+
+        # The KV cache is sized by n_ctx, so don't allocate past what the model can actually use.
+        n_ctx: int = max_n_ctx
+        if self.n_ctx_train:
+            n_ctx = min(n_ctx, self.n_ctx_train)
+
+        import llama_cpp
+
         logger.info(f"Loading llama_cpp model: {self.model_path}")
-        self.underlying_model = llama_cpp.Llama(
-            model_path=self.model_path,
-            n_gpu_layers=-1,
-            verbose=verbose,
-            # TODO: Figure out a more elegant way to decide the max.
-            n_ctx=32_768,
-        )
+        def construct_locked() -> llama_cpp.Llama:
+            # Other models' launches and model-list probes can be constructing a Llama at the same time.
+            with _llama_construction_lock:
+                return llama_cpp.Llama(
+                    model_path=self.model_path,
+                    n_gpu_layers=-1,
+                    verbose=verbose,
+                    n_ctx=n_ctx,
+                    n_batch=min(n_batch, n_ctx),
+                    n_ubatch=min(n_ubatch, n_batch, n_ctx),
+                    n_threads=n_threads,
+                    n_threads_batch=n_threads_batch,
+                )
+
+        # Loading can take a while (mmap + GPU offload), so keep it off the event loop.
+        underlying_model: llama_cpp.Llama = await asyncio.to_thread(construct_locked)
+
+        # llama_cpp restores the KV state for the longest cached token prefix, so regenerated or extended
+        # chats only need to prefill the new suffix. The cache is per-model, and gets dropped with it.
+        if prompt_cache_bytes:
+            underlying_model.set_cache(llama_cpp.LlamaRAMCache(capacity_bytes=prompt_cache_bytes))
+
+        self.underlying_model = underlying_model
 
         # DEBUG: Check the contents of this, decide whether to put it in storage
-        print(llama_cpp.llama_print_system_info().decode("utf-8"))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(llama_cpp.llama_print_system_info().decode("utf-8", "replace"))
 
-    async def available(self) -> bool:
-        # Do a quick tokenize/detokenize test run
-        sample_text_str = "✎👍 ｃｏｍｐｌｅｘ UTF-8 𝓉𝑒𝓍𝓉, but mostly em🍪jis  🎀  🐔 ⋆ 🐞"
-        sample_text: bytes = sample_text_str.encode('utf-8')
+    def unload(self) -> None:
+        """
+        Frees the llama.cpp context and offloaded layers now, rather than whenever the _OneModel gets collected,
+        so they're gone before the next model competes for the same VRAM.
+
+        Streams that are already running hold their own reference, and finish normally.
+        """
+        self.underlying_model = None
 
+    def _load_vocab_only(self) -> 'llama_cpp.Llama | None':
+        # Renamed, truncated, or still-downloading files fail here, without llama.cpp mmap'ing anything.
         try:
-            just_tokens: llama_cpp.Llama = llama_cpp.Llama(
-                model_path=self.model_path,
-                verbose=False,
-                vocab_only=True,
-                logits_all=True,
-            )
+            with open(self.model_path, 'rb') as f:
+                magic: bytes = f.read(4)
+        except OSError:
+            logger.debug(f"LlamaCppProvider: Failed to open file, ignoring: {self.model_path}")
+            return None
+
+        if magic != b'GGUF':
+            logger.debug(f"LlamaCppProvider: Not a .gguf file, ignoring: {self.model_path}")
+            return None
+
+        import llama_cpp
+
+        try:
+            with _llama_construction_lock:
+                return llama_cpp.Llama(
+                    model_path=self.model_path,
+                    verbose=False,
+                    vocab_only=True,
+                )
         except ValueError as e:
             # Exception usually happens because we loaded an invalid .gguf file; ignore it.
-            # logger.debug(e)
-            return False
+            logger.debug(f"LlamaCppProvider: Failed to load file, ignoring: {self.model_path}")
+            logger.debug(e)
+            return None
+
+    @staticmethod
+    def _check_tokenizer(just_tokens: 'llama_cpp.Llama') -> bool:
+        # Do a quick tokenize/detokenize test run
+        sample_text_str = "✎👍 ｃｏｍｐｌｅｘ UTF-8 𝓉𝑒𝓍𝓉, but mostly em🍪jis  🎀  🐔 ⋆ 🐞"
+        sample_text: bytes = sample_text_str.encode('utf-8')
 
         tokenized: list[int] = just_tokens.tokenize(sample_text)
         detokenized: bytes = just_tokens.detokenize(tokenized)
 
         return sample_text == detokenized
 
-    async def as_info(
+    @staticmethod
+    def _read_inference_params(info_only: 'llama_cpp.Llama') -> JSONDict:
+        # NB These are part of the model's identity (`combined_inference_parameters`), so the shape can't change
+        # without every existing lcp FoundationModelRecord getting re-created as a duplicate.
+        model_params = info_only.model_params
+        inference_params: JSONDict = {}
+        for field, always_int in _model_param_fields(type(model_params)):
+            value = getattr(model_params, field)
+            if always_int or isinstance(value, (bool, int)):
+                inference_params[field] = value
+            elif field in ("kv_overrides", "tensor_split"):
+                # The ctypes versions of these are raw pointers, so read the Python-side copies from the Llama.
+                inference_params[field] = getattr(info_only, field)
+            elif field not in ("progress_callback", "progress_callback_user_data"):
+                inference_params[field] = str(value)
+
+        # Keep these sorted in alphabetical order, for consistency
+        return dict(sorted(inference_params.items()))
+
+    def _read_gguf(self) -> tuple[bool, JSONDict | None, JSONDict | None]:
+        """
+        Blocking half of probe(): returns `(tokenizer_roundtrips, gguf_metadata, inference_params)`.
+        """
+        info_only: llama_cpp.Llama | None = self._load_vocab_only()
+        if info_only is None or not self._check_tokenizer(info_only):
+            return False, None, None
+
+        return True, dict(info_only.metadata), self._read_inference_params(info_only)
+
+    async def probe(
             self,
             provider_record: ProviderRecord,
             path_prefix: str,
-    ) -> FoundationModelRecord | None:
-        info_only: llama_cpp.Llama
+            history_db: HistoryDB,
+            existing_models: dict[_ExistingModelKey, FoundationModelRecord],
+            read_semaphore: asyncio.Semaphore | None = None,
+    ) -> tuple[bool, FoundationModelRecord | None]:
+        """
+        Checks that the file is a usable model, and if so, returns its info.
+
+        Both parts need the same `Llama(vocab_only=True)`, so the .gguf is opened at most once,
+        and not at all if the file hasn't changed since the last scan.
+
+        Several probes can share one `history_db`, as long as they're all on the same event loop:
+        the only await is the .gguf read, and all the session work happens on either side of it.
+        """
+        # Unchanged files with already-known models don't write anything, so a rescan needs no commits at all.
+        needs_commit: bool = False
+
         try:
-            info_only = llama_cpp.Llama(
-                model_path=self.model_path,
-                verbose=False,
-                vocab_only=True,
-                logits_all=True,
-            )
-        except ValueError as e:
-            logger.error(f"LlamaCppProvider.as_info: Failed to load file, ignoring: {self.model_path}")
-            logger.debug(e)
-            return None
+            cache_entry: GgufMetadataCacheOrm = lookup_gguf_metadata(self.model_path, history_db)
+        except OSError:
+            # The file was deleted or moved since the directory scan found it.
+            logger.debug(f"LlamaCppProvider: Failed to stat file, ignoring: {self.model_path}")
+            return False, None
+
+        if cache_entry.tokenizer_roundtrips is None or (
+                cache_entry.tokenizer_roundtrips
+                and (cache_entry.gguf_metadata is None or cache_entry.inference_params is None)
+        ):
+            async with read_semaphore or contextlib.nullcontext():
+                tokenizer_roundtrips, gguf_metadata, inference_params = await asyncio.to_thread(self._read_gguf)
+
+            # Other probes may have committed (expiring our entry) or rolled back (discarding it) meanwhile.
+            # Still-pending rows aren't visible to `Session.get()`, though, so those have to be reused as-is.
+            if cache_entry not in history_db.new:
+                try:
+                    cache_entry = lookup_gguf_metadata(self.model_path, history_db)
+                except OSError:
+                    logger.debug(f"LlamaCppProvider: Failed to stat file, ignoring: {self.model_path}")
+                    return False, None
+            cache_entry.tokenizer_roundtrips = tokenizer_roundtrips
+            if tokenizer_roundtrips:
+                cache_entry.gguf_metadata = gguf_metadata
+                cache_entry.inference_params = inference_params
+            needs_commit = True
+
+        tokenizer_roundtrips: bool = cache_entry.tokenizer_roundtrips
+        model_record: FoundationModelRecord | None = None
+        if tokenizer_roundtrips:
+            # _as_info() only adds to existing_models when it had to create (and flush) a new record.
+            known_model_count: int = len(existing_models)
+            model_record = self._as_info(cache_entry, provider_record, path_prefix, history_db, existing_models)
+            needs_commit = needs_commit or len(existing_models) != known_model_count
+
+        if not needs_commit:
+            return tokenizer_roundtrips, model_record
+
+        # One commit covers the cache entry and any newly-created model record.
+        # Don't leave it pending for a later batch, though: other writers only wait a second for the lock.
+        try:
+            history_db.commit()
+        except sqlalchemy.exc.SQLAlchemyError:
+            logger.exception(f"Failed to commit probe results for {self.model_path}")
+            history_db.rollback()
+            return tokenizer_roundtrips, None
 
-        model_name = os.path.basename(self.model_path)
-        if model_name[-5:] == '.gguf':
-            model_name = model_name[:-5]
+        return tokenizer_roundtrips, model_record
 
-        model_identifiers = info_only.metadata
+    def _as_info(
+            self,
+            cache_entry: GgufMetadataCacheOrm,
+            provider_record: ProviderRecord,
+            path_prefix: str,
+            history_db: HistoryDB,
+            existing_models: dict[_ExistingModelKey, FoundationModelRecord],
+    ) -> FoundationModelRecord:
+        """
+        Already-known models aren't written here; the caller bumps their `last_seen` in one statement per scan.
+        """
+        model_name = os.path.basename(self.model_path).removesuffix('.gguf')
+
+        model_identifiers = dict(cache_entry.gguf_metadata)
         # TODO: This shouldn't be part of the unique identifiers, but then, what would?
         model_identifiers["path"] = os.path.relpath(self.model_path, path_prefix)
-        model_identifiers = orjson.loads(
-            # Keep these sorted in alphabetical order, for consistency
-            orjson.dumps(model_identifiers, option=orjson.OPT_SORT_KEYS)
-        )
+        # Keep these sorted in alphabetical order, for consistency
+        model_identifiers = dict(sorted(model_identifiers.items()))
 
-        inference_params = dict([
-            (field, getattr(info_only.model_params, field))
-            for field, _ in info_only.model_params._fields_
-        ])
-        for k, v in list(inference_params.items()):
-            if isinstance(v, (bool, int)):
-                inference_params[k] = v
-            elif k in ("kv_overrides", "tensor_split"):
-                inference_params[k] = getattr(info_only, k)
-            elif k in ("progress_callback", "progress_callback_user_data"):
-                del inference_params[k]
-            else:
-                inference_params[k] = str(v)
-
-        inference_params = orjson.loads(
-            # Keep these sorted in alphabetical order, for consistency
-            orjson.dumps(inference_params, option=orjson.OPT_SORT_KEYS)
-        )
+        inference_params = dict(cache_entry.inference_params)
 
         access_time = datetime.now(tz=timezone.utc)
+        model_key: _ExistingModelKey = _existing_model_key(model_name, model_identifiers, inference_params)
+        existing_model: FoundationModelRecord | None = existing_models.get(model_key)
+        if existing_model is not None:
+            return existing_model.model_copy(update={"last_seen": access_time})
+
         model_in = FoundationModelAddRequest(
             human_id=model_name,
             first_seen_at=access_time,
@@ -131,43 +421,84 @@ class _OneModel:
             combined_inference_parameters=inference_params,
         )
 
-        history_db: HistoryDB = next(get_history_db())
-
-        maybe_model: FoundationModelRecordID | None = lookup_foundation_model_detailed(model_in, history_db)
-        if maybe_model is not None:
-            maybe_model.merge_in_updates(model_in)
-            history_db.add(maybe_model)
-            history_db.commit()
+        model_dump: dict = model_in.model_dump()
+        # The full GGUF metadata can run to hundreds of KB, so only serialize it when someone's going to see it.
+        logger.info(f"lcp constructed a new FoundationModelRecord: {model_in.human_id}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"lcp new FoundationModelRecord details: {orjson.dumps(model_dump).decode()}")
 
-            return FoundationModelRecord.model_validate(maybe_model)
-
-        else:
-            logger.info(f"lcp constructed a new FoundationModelRecord: {model_in.model_dump_json()}")
-            new_model = FoundationModelRecordOrm(**model_in.model_dump())
-            history_db.add(new_model)
-            history_db.commit()
+        new_model = FoundationModelRecordOrm(**model_dump)
+        history_db.add(new_model)
+        # Flush to get an ID; probe() commits.
+        history_db.flush()
 
-            return FoundationModelRecord.model_validate(new_model)
+        new_record = FoundationModelRecord.model_validate(new_model)
+        existing_models[model_key] = new_record
+        return new_record
 
 
 class LlamaCppProvider(BaseProvider):
     search_dir: str
 
-    loaded_models: dict[FoundationModelRecordID, _OneModel] = {}
+    loaded_models: OrderedDict[FoundationModelRecordID, _OneModel]
+    """Least-recently-used first, so eviction is just `popitem(last=False)`."""
     max_loaded_models: int
+    prompt_cache_bytes: int | None
+    """
+    Opt-in (see `BROKEGEN_LCP_PROMPT_CACHE_BYTES`), per loaded model. The cache snapshots the whole KV state after every completion (under the model's
+    inference lock), which only pays off when switching between several chats; `Llama` already reuses
+    the prefix of the immediately-preceding prompt without one.
+    """
+    launch_kwargs: dict[str, Any]
+    """
+    Passed through to every `_OneModel.launch()`, so prefill batching/threading can be tuned per provider.
+
+    LlamaCppProviderFactory fills these in from `BROKEGEN_LCP_N_BATCH`, `BROKEGEN_LCP_N_THREADS`, etc.
+    """
+    _provider_record: ProviderRecord | None
+    """Every input to make_record() is fixed for the life of the process, so the result is too."""
+    _provider_record_lock: asyncio.Lock
 
     def __init__(
             self,
             search_dir: str,
             max_loaded_models: int = 3,
+            prompt_cache_bytes: int | None = None,
+            n_batch: int = 2048,
+            n_ubatch: int = 512,
+            n_threads: int | None = None,
+            n_threads_batch: int | None = None,
     ):
         self.search_dir = search_dir
+        self.loaded_models = OrderedDict()
         self.max_loaded_models = max_loaded_models
+        self.prompt_cache_bytes = prompt_cache_bytes
+        self.launch_kwargs = {
+            "n_batch": n_batch,
+            "n_ubatch": n_ubatch,
+            "n_threads": n_threads,
+            "n_threads_batch": n_threads_batch,
+        }
+        self._provider_record = None
+        self._provider_record_lock = asyncio.Lock()
 
     async def available(self) -> bool:
         return os.path.exists(self.search_dir)
 
     async def make_record(self) -> ProviderRecord:
+        if self._provider_record is not None:
+            return self._provider_record
+
+        # Concurrent cold-start callers would otherwise each try to insert the same ProviderRecord.
+        async with self._provider_record_lock:
+            if self._provider_record is None:
+                self._provider_record = await self._make_record_nocache()
+
+        return self._provider_record
+
+    async def _make_record_nocache(self) -> ProviderRecord:
+        import llama_cpp
+
         history_db: HistoryDB = next(get_history_db())
 
         provider_identifiers_dict = {
@@ -201,24 +532,89 @@ class LlamaCppProvider(BaseProvider):
             self,
     ) -> AsyncGenerator[FoundationModelRecord, None]:
         def _generate_filenames(rootpath):
-            for dirpath, _, filenames in os.walk(rootpath, followlinks=True):
-                for file in filenames:
-                    if file[-5:] != '.gguf':
-                        continue
-
-                    yield os.path.abspath(os.path.join(dirpath, file))
+            # os.scandir() gets file types from the directory listing itself, so most entries never need a stat().
+            pending_dirs: list[str] = [os.path.abspath(rootpath)]
+            while pending_dirs:
+                try:
+                    entries = os.scandir(pending_dirs.pop())
+                except OSError:
+                    # os.walk() also skipped unreadable directories
+                    continue
+
+                with entries:
+                    for entry in entries:
+                        # Symlinked directories are followed, same as the `os.walk(followlinks=True)` this replaced.
+                        if entry.is_dir():
+                            pending_dirs.append(entry.path)
+                        elif entry.name.endswith('.gguf') and entry.is_file():
+                            yield entry.path
 
         provider_record: ProviderRecord = await self.make_record()
+        # One session for the whole scan, rather than one per model file
+        history_db: HistoryDB = next(get_history_db())
+        path_prefix: str = os.path.abspath(self.search_dir)
+
+        # Fetch every record for this provider up front, rather than running one lookup query per model file.
+        existing_models: dict[_ExistingModelKey, FoundationModelRecord] = {
+            _existing_model_key(record.human_id, record.model_identifiers, record.combined_inference_parameters):
+                FoundationModelRecord.model_validate(record)
+            for record in history_db.execute(
+                select(FoundationModelRecordOrm)
+                .where(FoundationModelRecordOrm.provider_identifiers == provider_record.identifiers)
+            ).scalars()
+        }
+        prefetched_ids: set[FoundationModelRecordID] = {record.id for record in existing_models.values()}
+        seen_model_ids: list[FoundationModelRecordID] = []
+
+        # Uncached files each need a blocking .gguf read, so overlap a few of those in worker threads.
+        # The `Llama()` constructions themselves still take turns, under _llama_construction_lock.
+        read_semaphore = asyncio.Semaphore(min(8, os.cpu_count() or 1))
+        model_paths: set[str] = set(_generate_filenames(self.search_dir))
+        probe_tasks: list[asyncio.Task] = [
+            asyncio.create_task(
+                _OneModel(model_path).probe(provider_record, path_prefix, history_db, existing_models, read_semaphore))
+            for model_path in model_paths
+        ]
+
+        try:
+            for next_probe in asyncio.as_completed(probe_tasks):
+                is_valid, temp_model_response = await next_probe
+                if is_valid and temp_model_response is not None:
+                    if temp_model_response.id in prefetched_ids:
+                        seen_model_ids.append(temp_model_response.id)
 
-        for model_path in _generate_filenames(self.search_dir):
-            temp_model: _OneModel = _OneModel(model_path)
-            if not await temp_model.available():
-                continue
+                    yield temp_model_response
 
-            temp_model_response: FoundationModelRecord | None
-            temp_model_response = await temp_model.as_info(provider_record, os.path.abspath(self.search_dir))
-            if temp_model_response is not None:
-                yield temp_model_response
+            # Only a scan that ran to completion knows which files are gone.
+            try:
+                if prune_gguf_metadata(self.search_dir, model_paths, history_db):
+                    history_db.commit()
+            except sqlalchemy.exc.SQLAlchemyError:
+                logger.exception(f"Failed to prune GGUF metadata cache for {self.search_dir}")
+                history_db.rollback()
+
+        finally:
+            for task in probe_tasks:
+                task.cancel()
+            # Anything cancelled mid-probe has to finish unwinding before we touch the session again.
+            await asyncio.gather(*probe_tasks, return_exceptions=True)
+
+            # Equivalent to merge_in_updates() on every known model, but as a single UPDATE.
+            if seen_model_ids:
+                last_seen = datetime.now(tz=timezone.utc)
+                try:
+                    history_db.execute(
+                        update(FoundationModelRecordOrm)
+                        .where(FoundationModelRecordOrm.id.in_(seen_model_ids))
+                        .values(
+                            last_seen=last_seen,
+                            first_seen_at=func.coalesce(FoundationModelRecordOrm.first_seen_at, last_seen),
+                        )
+                    )
+                    history_db.commit()
+                except sqlalchemy.exc.SQLAlchemyError:
+                    logger.exception(f"Failed to update last_seen for {len(seen_model_ids)} lcp models")
+                    history_db.rollback()
 
     async def list_models_nocache(
             self,
@@ -245,24 +641,23 @@ class LlamaCppProvider(BaseProvider):
         if inference_model.id not in self.loaded_models:
             new_model: _OneModel = _OneModel(
                 os.path.abspath(os.path.join(self.search_dir,
-                                             safe_get(inference_model.model_identifiers, "path")))
+                                             safe_get(inference_model.model_identifiers, "path"))),
+                n_ctx_train=_context_length_from(inference_model.model_identifiers),
             )
             while len(self.loaded_models) >= self.max_loaded_models:
-                # Use this elaborate syntax so we delete the _oldest_ item.
-                del self.loaded_models[
-                    next(iter(self.loaded_models))
-                ]
+                _, evicted_model = self.loaded_models.popitem(last=False)
+                evicted_model.unload()
 
             self.loaded_models[inference_model.id] = new_model
 
-        await self.loaded_models[inference_model.id].launch()
-        underlying_model: llama_cpp.Llama = self.loaded_models[inference_model.id].underlying_model
+        else:
+            self.loaded_models.move_to_end(inference_model.id)
 
-        maybe_inference_options: dict = {}
-        if inference_options.inference_options:
-            maybe_inference_options.update(
-                orjson.loads(inference_options.inference_options)
-            )
+        loaded_model: _OneModel = self.loaded_models[inference_model.id]
+        await loaded_model.launch(prompt_cache_bytes=self.prompt_cache_bytes, **self.launch_kwargs)
+        underlying_model: llama_cpp.Llama = loaded_model.underlying_model
+
+        maybe_inference_options: dict = inference_options.parsed_inference_options
 
         def content_extractor(chunk: JSONDict) -> JSONDict:
             response_choices = safe_get(chunk, "choices")
@@ -271,107 +666,84 @@ class LlamaCppProvider(BaseProvider):
 
             return response_choices[0]
 
-        def content_consolidator(chunk: JSONDict, response: JSONDict) -> JSONDict:
-            for k, v in chunk.items():
-                if k not in response:
-                    response[k] = v
-                elif k == 'choices':
-                    if len(v) > 1:
-                        logger.warning(f"Received {len(v)} choices, ignoring all but the first")
-                    for k3, v3 in v[0].items():
-                        if k3 not in response[k]:
-                            response[k][0][k3] = v3
-                        elif k3 == 'delta':
-                            for k4, v4 in v3.items():
-                                if k4 not in response[k][0][k3]:
-                                    response[k][0][k3][k4] = v4
-                                elif k4 == 'content':
-                                    if response[k][0][k3][k4] is None:
-                                        response[k][0][k3][k4] = safe_get_arrayed(chunk, k, 0, k3, k4)
-                                    else:
-                                        response[k][0][k3][k4] += safe_get_arrayed(chunk, k, 0, k3, k4) or ""
-                                else:
-                                    if response[k][0][k3][k4] != v4:
-                                        logger.debug(f"Didn't handle duplicate field: {k}[0].{k3}.{k4}={v4}")
-                        else:
-                            if response[k][k3] != v3:
-                                logger.debug(f"Didn't handle duplicate field: {k}.{k3}={v3}")
-                # TODO: Figure out why this field exists, shouldn't the order of calls prevent this?
-                elif k == 'message':
-                    for k2, v2 in v.items():
-                        if k2 not in response[k]:
-                            response[k][k2] = v2
-                        elif k2 == 'content':
-                            if response[k][k2] is None:
-                                response[k][k2] = safe_get(chunk, k, k2)
-                            else:
-                                response[k][k2] += safe_get(chunk, k, k2) or ""
-                        else:
-                            if response[k][k2] != v2:
-                                logger.debug(f"Didn't handle duplicate field: {k}.{k2}={v2}")
-                else:
-                    if response[k] != v:
-                        logger.debug(f"Didn't handle duplicate field: {k}={v}")
-
-            return response
-
-        async def format_response(primordial: AsyncIterator[JSONDict]) -> AsyncIterator[JSONDict]:
-            async for chunk in primordial:
-                response_choices = safe_get(chunk, "choices")
-                if len(response_choices) > 1:
-                    logger.warning(f"Received {len(response_choices)=}, ignoring all but the first")
+        # Read on the event loop; the ORM object belongs to the request's session, which isn't thread-safe.
+        inference_model_id: FoundationModelRecordID = inference_model.id
+
+        def record_inference_event(final_chunk: JSONDict) -> None:
+            """
+            Runs in a worker thread, with its own session: the request's `history_db` may be closed by then.
+            """
+            # Nothing reads this row back during the request, so skip the ORM unit-of-work and insert it directly.
+            inference_event_values: JSONDict = {
+                "model_record_id": inference_model_id,
+                "prompt_with_templating": None,
+                "reason": "LlamaCppProvider.chat_from",
+                "response_created_at": datetime.now(tz=timezone.utc),
+            }
+
+            # When llama_cpp reports usage at all, it's on the final chunk.
+            if safe_get(final_chunk, "usage", "prompt_tokens"):
+                inference_event_values["prompt_tokens"] = safe_get(final_chunk, "usage", "prompt_tokens")
+            if safe_get(final_chunk, "usage", "completion_tokens"):
+                inference_event_values["response_tokens"] = safe_get(final_chunk, "usage", "completion_tokens")
+
+            event_db: HistoryDB = next(get_history_db())
+            try:
+                event_db.execute(insert(InferenceEventOrm.__table__).values(**inference_event_values))
+                event_db.commit()
+            except sqlalchemy.exc.SQLAlchemyError:
+                logger.exception(f"Failed to commit InferenceEvent {inference_event_values}")
+                event_db.rollback()
+            finally:
+                event_db.close()
+
+        def locked_completion() -> Iterator[JSONDict]:
+            """
+            Runs entirely on the producer thread: even creating the completion does chat templating
+            and grammar setup, which shouldn't block the event loop either.
+            """
+            with loaded_model.inference_lock:
+                iterator_or_completion: (
+                        llama_cpp.CreateChatCompletionResponse
+                        | Iterator[llama_cpp.CreateChatCompletionStreamResponse])
+                iterator_or_completion = underlying_model.create_chat_completion(
+                    messages=[m.chat_completion_dict for m in messages_list],
+                    stream=True,
+                    **maybe_inference_options,
+                )
+
+                if not isinstance(iterator_or_completion, Iterator):
+                    iterator_or_completion = iter([content_extractor(iterator_or_completion)])
+
+                yield from iterator_or_completion
+
+        async def format_response() -> AsyncIterator[JSONDict]:
+            """
+            Formats, consolidates, and logs in a single generator, so each token only crosses one async boundary.
+
+            The blocking llama_cpp iterator is drained from a producer thread, so the event loop stays free.
+            """
+            # The InferenceEvent only needs usage stats, so there's no reason to hold on to the generated text.
+            last_chunk: JSONDict = {}
+
+            # Bounded generously: a stalled client only pauses inference (while holding the model lock)
+            # once it's hundreds of tokens behind.
+            async for chunks in to_async_threaded_batches(locked_completion(), max_batch_len=16, max_queue_len=256):
+                chunk, extracted_content = coalesce_chat_completion_chunks(chunks)
 
                 # Duplicate the output into the field we expected.
                 # TODO: Confirm that this is just an "OpenAI-compatible" output.
-                extracted_content: str = safe_get_arrayed(response_choices, 0, 'delta', 'content')
                 chunk['message'] = {
                     "role": "assistant",
                     "content": extracted_content,
                 }
 
                 yield chunk
+                last_chunk = chunk
 
-        async def record_inference_event(consolidated_response: JSONDict):
-            inference_event = InferenceEventOrm(
-                model_record_id=inference_model.id,
-                prompt_with_templating=None,
-                reason="LlamaCppProvider.chat_from",
-                response_created_at=datetime.now(tz=timezone.utc),
-            )
-
-            if safe_get(consolidated_response, "usage", "prompt_tokens"):
-                inference_event.prompt_tokens = safe_get(consolidated_response, "usage", "prompt_tokens")
-            if safe_get(consolidated_response, "usage", "completion_tokens"):
-                inference_event.response_tokens = safe_get(consolidated_response, "usage", "completion_tokens")
-
-            try:
-                history_db.add(inference_event)
-                history_db.commit()
-            except sqlalchemy.exc.SQLAlchemyError:
-                logger.exception(f"Failed to commit {inference_event}")
-                history_db.rollback()
-
-        # Main function body: wrap up
-        iterator_or_completion: (
-                llama_cpp.CreateChatCompletionResponse | Iterator[llama_cpp.CreateChatCompletionStreamResponse])
-        iterator_or_completion = underlying_model.create_chat_completion(
-            messages=[m.model_dump() for m in messages_list],
-            stream=True,
-            **maybe_inference_options,
-        )
-
-        if isinstance(iterator_or_completion, Iterator):
-            iter0: Iterator[JSONDict] = iterator_or_completion
-            iter1: AsyncIterator[JSONDict] = to_async(iter0)
-        else:
-            async def async_wrapper() -> AsyncIterator[JSONDict]:
-                yield content_extractor(iterator_or_completion)
-
-            iter1: AsyncIterator[JSONDict] = async_wrapper()
-
-        iter2: AsyncIterator[JSONDict] = consolidate_and_call(
-            iter1, content_consolidator, {},
-            record_inference_event)
-        iter3: AsyncIterator[JSONDict] = format_response(iter2)
+            # Nothing in the stream depends on this write, so let the response finish without waiting for it.
+            record_task = asyncio.create_task(asyncio.to_thread(record_inference_event, last_chunk))
+            _background_tasks.add(record_task)
+            record_task.add_done_callback(_background_tasks.discard)
 
-        return iter3
+        return format_response()
@@ -0,0 +1,110 @@
+import os
+
+import pytest
+
+import client.database
+from client.database import HistoryDB
+from providers_registry.lcp.orm import GgufMetadataCacheOrm, lookup_gguf_metadata, prune_gguf_metadata
+
+
+@pytest.fixture(scope="function")
+def history_db() -> HistoryDB:
+    client.database.load_db_models_pytest()
+    db: HistoryDB = next(client.database.get_db())
+    yield db
+    db.close()
+    client.database.SessionLocal = None
+
+
+def _cache_probe_result(model_path, history_db: HistoryDB) -> GgufMetadataCacheOrm:
+    cache_entry = lookup_gguf_metadata(str(model_path), history_db)
+    cache_entry.tokenizer_roundtrips = True
+    cache_entry.gguf_metadata = {"general.architecture": "llama"}
+    cache_entry.inference_params = {"n_gpu_layers": -1}
+    history_db.commit()
+
+    return cache_entry
+
+
+def test_lookup_new_file(tmp_path, history_db):
+    model_path = tmp_path / "model.gguf"
+    model_path.write_bytes(b"GGUF")
+
+    cache_entry = lookup_gguf_metadata(str(model_path), history_db)
+
+    assert cache_entry in history_db.new
+    assert cache_entry.st_size == 4
+    assert cache_entry.tokenizer_roundtrips is None
+
+
+def test_lookup_unchanged_file_hits(tmp_path, history_db):
+    model_path = tmp_path / "model.gguf"
+    model_path.write_bytes(b"GGUF")
+    _cache_probe_result(model_path, history_db)
+
+    cache_entry = lookup_gguf_metadata(str(model_path), history_db)
+
+    assert cache_entry.tokenizer_roundtrips is True
+    assert cache_entry.gguf_metadata == {"general.architecture": "llama"}
+
+
+def test_lookup_changed_file_resets(tmp_path, history_db):
+    model_path = tmp_path / "model.gguf"
+    model_path.write_bytes(b"GGUF")
+    _cache_probe_result(model_path, history_db)
+
+    model_path.write_bytes(b"GGUF, but longer")
+    cache_entry = lookup_gguf_metadata(str(model_path), history_db)
+
+    assert cache_entry.st_size == 16
+    assert cache_entry.tokenizer_roundtrips is None
+    assert cache_entry.gguf_metadata is None
+    assert cache_entry.inference_params is None
+
+
+def test_lookup_new_llama_cpp_version_resets(tmp_path, history_db):
+    model_path = tmp_path / "model.gguf"
+    model_path.write_bytes(b"GGUF")
+    cache_entry = _cache_probe_result(model_path, history_db)
+    cache_entry.llama_cpp_version = "0.0.0-not-installed"
+    history_db.commit()
+
+    cache_entry = lookup_gguf_metadata(str(model_path), history_db)
+
+    assert cache_entry.tokenizer_roundtrips is None
+
+
+def test_lookup_missing_file_raises(tmp_path, history_db):
+    with pytest.raises(FileNotFoundError):
+        lookup_gguf_metadata(str(tmp_path / "missing.gguf"), history_db)
+
+
+def test_prune_deletes_only_unseen_files_under_search_dir(tmp_path, history_db):
+    search_dir = tmp_path / "models"
+    sibling_dir = tmp_path / "models-other"
+    for model_dir in (search_dir, sibling_dir):
+        model_dir.mkdir()
+        for name in ("kept.gguf", "gone.gguf"):
+            (model_dir / name).write_bytes(b"GGUF")
+            _cache_probe_result(model_dir / name, history_db)
+
+    deleted_count = prune_gguf_metadata(str(search_dir), {str(search_dir / "kept.gguf")}, history_db)
+    history_db.commit()
+
+    assert deleted_count == 1
+    assert sorted(
+        os.path.relpath(cache_entry.model_path, tmp_path)
+        for cache_entry in history_db.query(GgufMetadataCacheOrm)
+    ) == sorted([
+        os.path.join("models", "kept.gguf"),
+        os.path.join("models-other", "gone.gguf"),
+        os.path.join("models-other", "kept.gguf"),
+    ])
+
+
+def test_prune_nothing_stale(tmp_path, history_db):
+    model_path = tmp_path / "model.gguf"
+    model_path.write_bytes(b"GGUF")
+    _cache_probe_result(model_path, history_db)
+
+    assert prune_gguf_metadata(str(tmp_path), {str(model_path)}, history_db) == 0
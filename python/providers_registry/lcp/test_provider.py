@@ -0,0 +1,88 @@
+import ctypes
+
+from providers_registry.lcp.provider import _OneModel, coalesce_chat_completion_chunks
+
+
+def _chunk(content: str | None, finish_reason: str | None = None, role: str | None = None) -> dict:
+    delta = {} if content is None else {"content": content}
+    if role is not None:
+        delta["role"] = role
+
+    return {
+        "id": "chatcmpl-1",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def test_coalesce_single_chunk_is_unchanged():
+    chunk = _chunk("Hello")
+
+    assert coalesce_chat_completion_chunks([chunk]) == (chunk, "Hello")
+    assert coalesce_chat_completion_chunks([chunk])[0] is chunk
+
+
+def test_coalesce_joins_content_into_last_chunk():
+    merged, merged_content = coalesce_chat_completion_chunks([
+        _chunk("Hello"),
+        _chunk(None),
+        _chunk(", "),
+        _chunk("world", finish_reason="stop"),
+    ])
+
+    assert merged_content == "Hello, world"
+    assert merged["choices"][0]["delta"]["content"] == "Hello, world"
+    assert merged["choices"][0]["finish_reason"] == "stop"
+
+
+def test_coalesce_keeps_first_chunk_role():
+    # llama_cpp only sends the role in the stream's first chunk
+    merged, _ = coalesce_chat_completion_chunks([_chunk(None, role="assistant"), _chunk("Hello"), _chunk("!")])
+
+    assert merged["choices"][0]["delta"] == {"role": "assistant", "content": "Hello!"}
+
+
+def test_coalesce_last_chunk_without_content():
+    # llama_cpp's final chunk usually has an empty delta
+    merged, merged_content = coalesce_chat_completion_chunks([_chunk("Hello"), _chunk(None, finish_reason="stop")])
+
+    assert merged_content == "Hello"
+    assert merged["choices"][0]["delta"] == {"content": "Hello"}
+
+
+def test_coalesce_malformed_last_chunk_keeps_it():
+    last_chunk = {"id": "chatcmpl-1", "choices": []}
+
+    assert coalesce_chat_completion_chunks([_chunk("Hello"), last_chunk]) == (last_chunk, "")
+
+
+class _FakeModelParams(ctypes.Structure):
+    _fields_ = [
+        ("n_gpu_layers", ctypes.c_int32),
+        ("split_mode", ctypes.c_int),
+        ("progress_callback", ctypes.CFUNCTYPE(ctypes.c_bool, ctypes.c_float, ctypes.c_void_p)),
+        ("progress_callback_user_data", ctypes.c_void_p),
+        ("rpc_servers", ctypes.c_char_p),
+        ("kv_overrides", ctypes.c_void_p),
+        ("tensor_split", ctypes.POINTER(ctypes.c_float)),
+        ("use_mmap", ctypes.c_bool),
+    ]
+
+
+class _FakeLlama:
+    kv_overrides = None
+    tensor_split = None
+
+    def __init__(self):
+        self.model_params = _FakeModelParams(n_gpu_layers=-1, use_mmap=True)
+
+
+def test_read_inference_params_shape():
+    # This is part of every lcp model's identity, so changing it would duplicate every FoundationModelRecord.
+    assert _OneModel._read_inference_params(_FakeLlama()) == {
+        "kv_overrides": None,
+        "n_gpu_layers": -1,
+        "rpc_servers": "None",
+        "split_mode": 0,
+        "tensor_split": None,
+        "use_mmap": True,
+    }
@@ -76,8 +76,9 @@ async def construct_new_sequence_from(
     if not assistant_message.content:
         return None
 
+    # Only flush here; this message, the new sequence, and the InferenceEvent back-reference all share one commit.
     history_db.add(assistant_message)
-    history_db.commit()
+    history_db.flush()
 
     # Add what we need for response_sequence
     response_sequence = ChatSequenceOrm(
@@ -98,13 +99,11 @@ async def construct_new_sequence_from(
     if inference_event.response_error:
         response_sequence.inference_error = inference_event.response_error
 
-    history_db.commit()
+    history_db.flush()
 
     # And complete the circular reference that really should be handled in the SQLAlchemy ORM
-    inference_job = history_db.merge(inference_event)
-    inference_job.parent_sequence = response_sequence.id
-
-    history_db.add(inference_job)
+    inference_event.parent_sequence = response_sequence.id
+    history_db.add(inference_event)
     history_db.commit()
 
     if not safe_get(consolidated_response, 'done'):
@@ -113,14 +112,42 @@ async def construct_new_sequence_from(
     return response_sequence, assistant_message
 
 
+_RESPONSE_PARTS_KEY = '_response_parts'
+_MESSAGE_CONTENT_PARTS_KEY = '_message_content_parts'
+
+
 def ollama_response_consolidator(
         chunk: OllamaResponseChunk,
         consolidated_response: OllamaResponseContentJSON,
 ) -> OllamaResponseContentJSON:
+    """
+    Streamed text gets buffered into lists, rather than `+=`'d onto the consolidated response;
+    call ollama_response_finalizer() to join them once streaming is done.
+    """
     if not consolidated_response:
-        return chunk
+        consolidated_response = {}
 
     for k, v in chunk.items():
+        # This tends to be the output from /api/generate
+        if k == 'response':
+            consolidated_response.setdefault(k, '')
+            consolidated_response.setdefault(_RESPONSE_PARTS_KEY, []).append(v)
+            continue
+
+        # And this is /api/chat, which we don't care too much about.
+        # Except as a stopgap, for now.
+        elif k == 'message':
+            if k not in consolidated_response:
+                consolidated_response[k] = dict(v)
+            else:
+                if set(v.keys()) != {'content', 'role'}:
+                    logger.warning(f"Received unexpected message content with keys: {v.keys()}")
+                if v['role'] != 'assistant':
+                    logger.warning(f"Received content for unexpected role \"{v['role']}\", continuing anyway")
+
+            consolidated_response.setdefault(_MESSAGE_CONTENT_PARTS_KEY, []).append(v['content'])
+            continue
+
         if k not in consolidated_response:
             consolidated_response[k] = v
             continue
@@ -138,22 +165,6 @@ def ollama_response_consolidator(
                 raise ValueError(
                     f"Received new model name \"{v}\" during streaming response, expected {consolidated_response[k]}")
 
-        # This tends to be the output from /api/generate
-        elif k == 'response':
-            consolidated_response[k] += v
-            continue
-
-        # And this is /api/chat, which we don't care too much about.
-        # Except as a stopgap, for now.
-        elif k == 'message':
-            if set(v.keys()) != {'content', 'role'}:
-                logger.warning(f"Received unexpected message content with keys: {v.keys()}")
-            if v['role'] != 'assistant':
-                logger.warning(f"Received content for unexpected role \"{v['role']}\", continuing anyway")
-
-            consolidated_response[k]['content'] += v['content']
-            continue
-
         else:
             raise ValueError(
                 f"Received unidentified JSON pair {k}={v}, abandoning consolidation of JSON blobs.\n"
@@ -163,3 +174,20 @@ def ollama_response_consolidator(
         consolidated_response[k] = v
 
     return consolidated_response
+
+
+def ollama_response_finalizer(
+        consolidated_response: OllamaResponseContentJSON,
+) -> OllamaResponseContentJSON:
+    """
+    Joins the text buffered by ollama_response_consolidator(), in place.
+    """
+    response_parts = consolidated_response.pop(_RESPONSE_PARTS_KEY, None)
+    if response_parts is not None:
+        consolidated_response['response'] = ''.join(response_parts)
+
+    message_content_parts = consolidated_response.pop(_MESSAGE_CONTENT_PARTS_KEY, None)
+    if message_content_parts is not None:
+        consolidated_response['message']['content'] = ''.join(message_content_parts)
+
+    return consolidated_response
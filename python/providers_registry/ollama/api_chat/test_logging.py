@@ -0,0 +1,81 @@
+import asyncio
+import functools
+
+from inference.iterators import consolidate_and_yield
+from providers_registry.ollama.api_chat.logging import ollama_response_consolidator, ollama_response_finalizer
+
+_generate_chunks = [
+    {"model": "llama3", "created_at": "2024-06-01T00:00:00Z", "response": "Hello", "done": False},
+    {"model": "llama3", "created_at": "2024-06-01T00:00:01Z", "response": ", ", "done": False},
+    {"model": "llama3", "created_at": "2024-06-01T00:00:02Z", "response": "world", "done": False},
+    {"model": "llama3", "created_at": "2024-06-01T00:00:03Z", "response": "", "done": True, "eval_count": 3},
+]
+
+_chat_chunks = [
+    {"model": "llama3", "created_at": "2024-06-01T00:00:00Z",
+     "message": {"role": "assistant", "content": "Hello"}, "done": False},
+    {"model": "llama3", "created_at": "2024-06-01T00:00:01Z",
+     "message": {"role": "assistant", "content": ", world"}, "done": False},
+    {"model": "llama3", "created_at": "2024-06-01T00:00:02Z",
+     "message": {"role": "assistant", "content": ""}, "done": True, "eval_count": 2},
+]
+
+
+def consolidate(chunks):
+    return ollama_response_finalizer(functools.reduce(
+        lambda consolidated, chunk: ollama_response_consolidator(chunk, consolidated), chunks, {}))
+
+
+def test_generate_stream():
+    consolidated = consolidate(_generate_chunks)
+
+    assert consolidated == {
+        "model": "llama3",
+        "created_at": "2024-06-01T00:00:00Z",
+        "terminal_created_at": "2024-06-01T00:00:03Z",
+        "response": "Hello, world",
+        "done": True,
+        "eval_count": 3,
+    }
+
+
+def test_chat_stream():
+    consolidated = consolidate(_chat_chunks)
+
+    assert consolidated == {
+        "model": "llama3",
+        "created_at": "2024-06-01T00:00:00Z",
+        "terminal_created_at": "2024-06-01T00:00:02Z",
+        "message": {"role": "assistant", "content": "Hello, world"},
+        "done": True,
+        "eval_count": 2,
+    }
+
+
+def test_consolidator_does_not_modify_chunks():
+    chunks = [dict(chunk, message=dict(chunk["message"])) for chunk in _chat_chunks]
+    consolidate(chunks)
+
+    assert chunks == _chat_chunks
+
+
+def test_consolidate_and_yield_finalizer():
+    consolidated_responses = []
+
+    async def on_done(consolidated_response):
+        consolidated_responses.append(consolidated_response)
+        yield {"done": True}
+
+    async def primordial():
+        for chunk in _generate_chunks:
+            yield chunk
+
+    async def collect():
+        return [chunk async for chunk in consolidate_and_yield(
+            primordial(), ollama_response_consolidator, {}, on_done,
+            finalizer=ollama_response_finalizer,
+        )]
+
+    assert asyncio.run(collect()) == _generate_chunks + [{"done": True}]
+    assert consolidated_responses[0]["response"] == "Hello, world"
+    assert "_response_parts" not in consolidated_responses[0]
@@ -13,7 +13,7 @@ from client.database import HistoryDB
 from inference.iterators import stream_bytes_to_json, consolidate_and_call, dump_to_bytes
 from providers.foundation_models.orm import InferenceEventOrm, InferenceReason
 from providers_registry.ollama.api_chat.logging import finalize_inference_job, OllamaRequestContentJSON, \
-    OllamaResponseContentJSON, ollama_response_consolidator
+    OllamaResponseContentJSON, ollama_response_consolidator, ollama_response_finalizer
 from providers_registry.ollama.models.lookup import lookup_model_offline
 from providers_registry.ollama.json import OllamaEgressEventBuilder
 from providers_registry.ollama.models.list import _real_ollama_client
@@ -85,6 +85,7 @@ async def do_generate_raw_templated(
         iter2: AsyncIterator[JSONDict] = consolidate_and_call(
             iter1, ollama_response_consolidator, {},
             do_finalize_inference_job,
+            finalizer=ollama_response_finalizer,
         )
         iter3: AsyncIterator[bytes] = dump_to_bytes(iter2)
 
@@ -23,7 +23,7 @@ from providers.foundation_models.orm import InferenceEventOrm
 from providers.registry import ProviderRegistry, InferenceOptions
 from providers_registry.ollama.api_chat.inject_rag import do_proxy_chat_rag
 from providers_registry.ollama.api_chat.logging import OllamaRequestContentJSON, OllamaResponseContentJSON, \
-    finalize_inference_job, ollama_response_consolidator, ollama_log_indexer
+    finalize_inference_job, ollama_response_consolidator, ollama_response_finalizer, ollama_log_indexer
 from providers_registry.ollama.api_generate import do_generate_raw_templated
 from providers_registry.ollama.models.lookup import lookup_model_offline
 from providers_registry.ollama.json import keepalive_wrapper
@@ -186,6 +186,7 @@ def install_forwards(app: FastAPI, force_ollama_rag: bool):
                     iter3: AsyncIterator[JSONDict] = consolidate_and_call(
                         iter2, ollama_response_consolidator, {},
                         record_inference_event,
+                        finalizer=ollama_response_finalizer,
                     )
 
                     ollama_response._content_iterable = iter3
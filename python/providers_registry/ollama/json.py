@@ -16,7 +16,8 @@ from _util.typing import FoundationModelHumanID
 from audit.content_scrubber import scrub_json
 from audit.http import AuditDB, get_db, EgressHttpEvent
 from inference.iterators import stream_bytes_to_json, tee_to_console_output, dump_to_bytes, consolidate_and_call
-from .api_chat.logging import ollama_log_indexer, ollama_response_consolidator, OllamaResponseContentJSON
+from .api_chat.logging import ollama_log_indexer, ollama_response_consolidator, ollama_response_finalizer, \
+    OllamaResponseContentJSON
 
 logger = logging.getLogger(__name__)
 
@@ -214,6 +215,7 @@ class OllamaEgressEventBuilder:
         iter3: AsyncIterator[JSONDict] = consolidate_and_call(
             iter2, ollama_response_consolidator, {},
             egress_event_recorder,
+            finalizer=ollama_response_finalizer,
         )
         iter4: AsyncIterator[bytes] = dump_to_bytes(iter3)
 
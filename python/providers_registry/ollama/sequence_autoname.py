@@ -11,7 +11,7 @@ from client.database import get_db as get_history_db
 from inference.iterators import decode_from_bytes, stream_str_to_json
 from inference.prompting.templating import apply_llm_template
 from providers.foundation_models.orm import FoundationModelRecordOrm, InferenceReason
-from .api_chat.logging import ollama_log_indexer, ollama_response_consolidator
+from .api_chat.logging import ollama_log_indexer, ollama_response_consolidator, ollama_response_finalizer
 from .api_generate import do_generate_raw_templated
 
 
@@ -57,7 +57,7 @@ async def do_autoname_sequence(
     async for chunk in iter2:
         consolidated_response = ollama_response_consolidator(chunk, consolidated_response)
 
-    return ollama_log_indexer(consolidated_response)
+    return ollama_log_indexer(ollama_response_finalizer(consolidated_response))
 
 
 async def autoname_sequence(
@@ -7,8 +7,8 @@ import fastapi.routing
 import sqlalchemy
 import starlette.datastructures
 import starlette.requests
-from fastapi import Depends
-from sqlalchemy import select
+import starlette.status
+from fastapi import Depends, HTTPException
 from starlette.responses import RedirectResponse
 
 from _util.json import JSONDict
@@ -29,7 +29,7 @@ from providers.orm import ProviderLabel
 from providers.registry import ProviderRegistry, InferenceOptions
 from retrieval.faiss.retrieval import RetrievalLabel
 from .api_chat.inject_rag import do_proxy_chat_rag
-from .api_chat.logging import ollama_response_consolidator, construct_new_sequence_from, \
+from .api_chat.logging import ollama_response_consolidator, ollama_response_finalizer, construct_new_sequence_from, \
     OllamaResponseContentJSON, finalize_inference_job, ollama_log_indexer
 from .json import keepalive_wrapper
 from .sequence_autoname import autoname_sequence
@@ -66,6 +66,7 @@ async def do_continuation(
         )
         finalize_inference_job(inference_event, consolidated_response)
 
+        # Commit this separately, so it survives even if constructing the ChatSequence fails.
         try:
             history_db.add(inference_event)
             history_db.commit()
@@ -167,6 +168,7 @@ async def do_continuation(
     iter4: AsyncIterator[JSONDict] = consolidate_and_yield(
         iter3, ollama_response_consolidator, {},
         functools.partial(append_response_chunk, prompt_with_templating=prompt_with_templating),
+        finalizer=ollama_response_finalizer,
     )
 
     proxied_response._content_iterable = iter4
@@ -186,15 +188,15 @@ def install_routes(router_ish: fastapi.FastAPI | fastapi.routing.APIRouter) -> N
             audit_db: AuditDB = Depends(get_audit_db),
             registry: ProviderRegistry = Depends(ProviderRegistry),
     ) -> JSONStreamingResponse | RedirectResponse:
-        original_sequence = history_db.execute(
-            select(ChatSequenceOrm)
-            .filter_by(id=sequence_id)
-        ).scalar_one()
-
         messages_list: list[ChatMessage] = \
             fetch_messages_for_sequence(sequence_id, history_db, include_model_info_diffs=False,
                                         include_sequence_info=True)
 
+        # fetch_messages_for_sequence() already loaded this row, so this is an identity map lookup.
+        original_sequence: ChatSequenceOrm | None = history_db.get(ChatSequenceOrm, sequence_id)
+        if original_sequence is None:
+            raise HTTPException(starlette.status.HTTP_404_NOT_FOUND, "No matching object")
+
         # Decide how to continue inference for this sequence
         inference_model: FoundationModelRecordOrm = \
             select_continuation_model(sequence_id, params.continuation_model_id, params.fallback_model_id, history_db)
@@ -252,10 +254,9 @@ def install_routes(router_ish: fastapi.FastAPI | fastapi.routing.APIRouter) -> N
                                         include_sequence_info=True)
 
         # First, store the message that was painstakingly generated for us.
-        original_sequence = history_db.execute(
-            select(ChatSequenceOrm)
-            .filter_by(id=sequence_id)
-        ).scalar_one()
+        original_sequence: ChatSequenceOrm | None = history_db.get(ChatSequenceOrm, sequence_id)
+        if original_sequence is None:
+            raise HTTPException(starlette.status.HTTP_404_NOT_FOUND, "No matching object")
 
         user_sequence = ChatSequenceOrm(
             human_desc=original_sequence.human_desc,
@@ -62,7 +62,8 @@ async def chat(
         def chat_extractor(chunk: JSONDict):
             return safe_get(chunk, "message", "content") or ""
 
-        iter0: AsyncIterator[str] = tee_to_console_output(streaming_result, chat_extractor)
+        # Console output is the whole point of this CLI, so always enable it.
+        iter0: AsyncIterator[str] = tee_to_console_output(streaming_result, chat_extractor, enabled=True)
 
         # Iterate over the whole result, so it prints.
         async for chunk in iter0: